@@ -5,52 +5,24 @@ import sys
 # 1. IMPORTAZIONE DEI MODULI NECESSARI
 try:
     import phase1_extract
+    import phase1_live
     import phase2_filters
     import phase3_stabilize
+    import phase3_remap
 except ImportError as e:
     print(f"ERRORE: Impossibile importare i moduli: {e}")
-    print("Assicurati che 'phase1_extract.py', 'phase2_filters.py', e 'phase3_stabilize.py' siano nella stessa cartella.")
+    print("Assicurati che 'phase1_extract.py', 'phase1_live.py', 'phase2_filters.py', 'phase3_stabilize.py' e 'phase3_remap.py' siano nella stessa cartella.")
     sys.exit(1)
 
 # 2. DEFINIZIONE DELLA FUNZIONE MAIN E DELLE COSTANTI
 BASE_INPUT_DIR = "./inputs"
 BASE_OUTPUT_DIR = "./outputs"
 
-def main(video_path, algorithm, smoothing_method):
+def run_phase2(algorithm, smoothing_method, x_act_path, v_act_path, video_name_base):
     """
-    Orchestra l'intera pipeline di stabilizzazione.
+    Esegue la Fase 2 con l'algoritmo selezionato.
+    Ritorna il percorso a X_smooth e la configurazione di trimming per la Fase 3.
     """
-    print("--- AVVIO PIPELINE ---")
-    print(f"  Video Sorgente: {video_path}")
-    print(f"  Algoritmo Selezionato: {algorithm}")
-    print(f"  Metodo di Smoothing: {smoothing_method}")
-    print("-" * 30)
-
-    # Verifica che il file video esista
-    if not os.path.exists(video_path):
-        print(f"ERRORE CRITICO: File video non trovato: {video_path}")
-        sys.exit(1)
-        
-    # definizione del nome base del video e delle cartelle di output
-    video_name_base = os.path.splitext(os.path.basename(video_path))[0]
-
-    phase1_output_dir = os.path.join(BASE_OUTPUT_DIR, "phase1", video_name_base)
-    
-    
-    # Fase 1: Estrazione Feature e Calcolo Traiettoria
-    x_act_path, v_act_path = phase1_extract.run_phase1(
-        video_file_path=video_path,
-        output_dir=phase1_output_dir,
-        video_name_base=video_name_base
-    )
-    
-    if x_act_path is None:
-        print("ERRORE CRITICO: Fase 1 (Estrazione Feature) fallita. Interruzione.")
-        sys.exit(1)
-
-    print("-" * 30)
-
-    # Fase 2: Filtraggio della Traiettoria
     x_smooth_path = None
     trim_config = {} # Il trimming è specifico per FPS
     phase2_output_dir = os.path.join(BASE_OUTPUT_DIR, f"phase2_{algorithm}", video_name_base)
@@ -103,19 +75,132 @@ def main(video_path, algorithm, smoothing_method):
         print(f"ERRORE CRITICO: Fase 2 ({algorithm}) fallita. Interruzione.")
         sys.exit(1)
 
+    return x_smooth_path, trim_config
+
+def main(video_path, algorithms, smoothing_method, workers=1, phase1_mode="dense",
+         calibration_path=None, rolling_shutter=0.0, verify_sparse=False):
+    """
+    Orchestra l'intera pipeline di stabilizzazione.
+    Con più algoritmi, la Fase 1 viene eseguita una sola volta e la Fase 3
+    decodifica il video una sola volta per tutti gli output.
+    """
+    if isinstance(algorithms, str):
+        algorithms = [algorithms]
+    algorithms = list(dict.fromkeys(algorithms)) # Rimuove i duplicati mantenendo l'ordine
+
+    print("--- AVVIO PIPELINE ---")
+    print(f"  Video Sorgente: {video_path}")
+    print(f"  Algoritmi Selezionati: {', '.join(algorithms)}")
+    print(f"  Metodo di Smoothing: {smoothing_method}")
+    print(f"  Modalità Fase 1: {phase1_mode}")
     print("-" * 30)
 
+    # Verifica che il file video esista
+    if not os.path.exists(video_path):
+        print(f"ERRORE CRITICO: File video non trovato: {video_path}")
+        sys.exit(1)
+        
+    # definizione del nome base del video e delle cartelle di output
+    video_name_base = os.path.splitext(os.path.basename(video_path))[0]
+
+    phase1_output_dir = os.path.join(BASE_OUTPUT_DIR, "phase1", video_name_base)
+    
+    
+    # Fase 1: Estrazione Feature e Calcolo Traiettoria
+    if phase1_mode == "live":
+        # Tracciamento adattivo con budget per frame (file cadenzato come una camera)
+        x_act_path, v_act_path = phase1_live.run_phase1_live(
+            source=video_path,
+            output_dir=phase1_output_dir,
+            video_name_base=video_name_base
+        )
+    elif phase1_mode == "sparse":
+        # Stima su keyframe con interpolazione nei tratti a basso movimento
+        x_act_path, v_act_path = phase1_extract.run_phase1_sparse(
+            video_file_path=video_path,
+            output_dir=phase1_output_dir,
+            video_name_base=video_name_base,
+            verify_dense=verify_sparse
+        )
+    else:
+        x_act_path, v_act_path = phase1_extract.run_phase1(
+            video_file_path=video_path,
+            output_dir=phase1_output_dir,
+            video_name_base=video_name_base
+        )
+    
+    if x_act_path is None:
+        print("ERRORE CRITICO: Fase 1 (Estrazione Feature) fallita. Interruzione.")
+        sys.exit(1)
+
+    print("-" * 30)
+
+    # Fase 2: Filtraggio della Traiettoria (una volta per algoritmo)
+    smooth_results = []
+    for algorithm in algorithms:
+        x_smooth_path, trim_config = run_phase2(algorithm, smoothing_method, x_act_path, v_act_path, video_name_base)
+        smooth_results.append((algorithm, x_smooth_path, trim_config))
+        print("-" * 30)
+
     # Fase 3: Stabilizzazione Video
     phase3_output_dir = os.path.join(BASE_OUTPUT_DIR, "phase3_final_videos")
-    final_video_path = os.path.join(phase3_output_dir, f"{video_name_base}_stabilizzato_{algorithm}_{smoothing_method}.mp4")
-    
-    success = phase3_stabilize.run_phase3(
-        video_input_path=video_path,
-        x_act_path=x_act_path,
-        x_smooth_path=x_smooth_path,
-        output_video_path=final_video_path,
-        trim_config=trim_config
-    )
+    final_video_paths = [
+        os.path.join(phase3_output_dir, f"{video_name_base}_stabilizzato_{algorithm}_{smoothing_method}.mp4")
+        for algorithm, _, _ in smooth_results
+    ]
+
+    # Undistorsione e rolling shutter: un unico remap per frame
+    warper = None
+    if calibration_path is not None or rolling_shutter != 0.0:
+        warper = phase3_remap.create_remap_warper(
+            video_input_path=video_path,
+            x_act_path=x_act_path,
+            calibration_path=calibration_path,
+            rolling_shutter=rolling_shutter
+        )
+        if warper is None:
+            print("ERRORE CRITICO: Creazione del motore di warp fallita. Interruzione.")
+            sys.exit(1)
+
+    if len(smooth_results) > 1:
+        # Confronto: una sola decodifica, K output e mosaico affiancato
+        if workers > 1:
+            print(f"ATTENZIONE: --workers {workers} ignorato, il confronto tra algoritmi usa un solo processo.")
+        variants = [
+            {"name": algorithm, "x_smooth_path": x_smooth_path,
+             "output_video_path": final_video_path, "trim_config": trim_config}
+            for (algorithm, x_smooth_path, trim_config), final_video_path in zip(smooth_results, final_video_paths)
+        ]
+        mosaic_path = os.path.join(phase3_output_dir, f"{video_name_base}_confronto_{'_'.join(algorithms)}.mp4")
+        success = phase3_stabilize.run_phase3_multi(
+            video_input_path=video_path,
+            x_act_path=x_act_path,
+            variants=variants,
+            mosaic_path=mosaic_path,
+            warper=warper
+        )
+    elif workers > 1:
+        # Rendering a segmenti in parallelo
+        _, x_smooth_path, trim_config = smooth_results[0]
+        success = phase3_stabilize.run_phase3_parallel(
+            video_input_path=video_path,
+            x_act_path=x_act_path,
+            x_smooth_path=x_smooth_path,
+            output_video_path=final_video_paths[0],
+            trim_config=trim_config,
+            n_workers=workers,
+            warper=warper
+        )
+    else:
+        _, x_smooth_path, trim_config = smooth_results[0]
+        success = phase3_stabilize.run_phase3(
+            video_input_path=video_path,
+            x_act_path=x_act_path,
+            x_smooth_path=x_smooth_path,
+            output_video_path=final_video_paths[0],
+            trim_config=trim_config,
+            warper=warper
+        )
 
     if not success:
         print("ERRORE CRITICO: Fase 3 (Stabilizzazione) fallita. Interruzione.")
@@ -123,7 +208,8 @@ def main(video_path, algorithm, smoothing_method):
         
     print("-" * 30)
     print("--- PIPELINE COMPLETATA CON SUCCESSO ---")
-    print(f"Video finale salvato in: {final_video_path}")
+    for final_video_path in final_video_paths:
+        print(f"Video finale salvato in: {final_video_path}")
 
 if __name__ == "__main__":
 
@@ -137,8 +223,9 @@ if __name__ == "__main__":
     parser.add_argument(
         "algorithm", 
         type=str, 
+        nargs="+",
         choices=["FPS", "MVI", "Kalman", "DL"], 
-        help="L'algoritmo di filtraggio da utilizzare"
+        help="L'algoritmo (o gli algoritmi da confrontare) di filtraggio da utilizzare"
     )
 
     parser.add_argument(
@@ -148,6 +235,45 @@ if __name__ == "__main__":
         help="Il metodo di smoothing da utilizzare (solo per FPS)",
         required=False, default=""
     )
+
+    parser.add_argument(
+        "--workers", "-w",
+        type=int,
+        help="Numero di processi per il rendering a segmenti della Fase 3 (1 = sequenziale)",
+        required=False, default=1
+    )
+
+    parser.add_argument(
+        "--phase1",
+        type=str,
+        choices=["dense", "live", "sparse"],
+        help="Modalità della Fase 1: tracciamento completo, adattivo con budget per frame o su keyframe",
+        required=False, default="dense"
+    )
+
+    parser.add_argument(
+        "--verify_sparse",
+        action="store_true",
+        help="Con --phase1 sparse, misura l'errore della traiettoria rispetto al tracciamento denso"
+    )
+
+    parser.add_argument(
+        "--calibration",
+        type=str,
+        help="File .npz con camera_matrix e dist_coeffs per rimuovere la distorsione della lente",
+        required=False, default=None
+    )
+
+    parser.add_argument(
+        "--rolling_shutter",
+        type=float,
+        help="Tempo di lettura del sensore come frazione del periodo di frame (0 = disattivato)",
+        required=False, default=0.0
+    )
     args = parser.parse_args()
+
+    if len(set(args.algorithm)) > 1 and args.workers > 1:
+        parser.error("--workers non è supportato con più algoritmi (il confronto decodifica il video una sola volta).")
     
-    main(args.video_path, args.algorithm, args.smoothing_method)
\ No newline at end of file
+    main(args.video_path, args.algorithm, args.smoothing_method, args.workers, args.phase1,
+         args.calibration, args.rolling_shutter, args.verify_sparse)
\ No newline at end of file
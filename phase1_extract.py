@@ -2,6 +2,167 @@ import cv2
 import numpy as np
 import os
 
+# --- Funzioni Helper Interne ---
+
+MAX_PUNTI = 200
+
+def _detect_points(gray, max_points=MAX_PUNTI):
+    # Rileva punti di interesse con Shi-Tomasi
+    return cv2.goodFeaturesToTrack(
+        gray, maxCorners=max_points, qualityLevel=0.1,
+        minDistance=7, blockSize=7
+    )
+
+def _estimate_motion(good_old, good_new):
+    """
+    Stima la trasformazione affine (parziale) tra i punti vecchi e nuovi.
+    Ritorna (dx, dy, d_theta), nulli se la stima fallisce.
+    """
+    m, _ = cv2.estimateAffinePartial2D(good_old, good_new, ransacReprojThreshold=3)
+    if m is None:
+        return 0.0, 0.0, 0.0
+    return m[0, 2], m[1, 2], np.arctan2(m[1, 0], m[0, 0])
+
+def _accumulate(trajectory_X_act, dx, dy, d_theta):
+    # Aggiorna la traiettoria accumulata con il vettore (dx, dy, d_theta)
+    last_x, last_y, last_theta = trajectory_X_act[-1]
+    new_theta = last_theta + d_theta
+    new_x = last_x + (dx * np.cos(last_theta) - dy * np.sin(last_theta))
+    new_y = last_y + (dx * np.sin(last_theta) + dy * np.cos(last_theta))
+    trajectory_X_act.append((new_x, new_y, new_theta))
+
+def _save_results(output_dir, trajectory_X_act, vectors_V_act):
+    """
+    Salva X_act e V_act in output_dir.
+    Ritorna i percorsi ai due file di dati.
+    """
+    output_data_X_act = os.path.join(output_dir, "traiettoria_rumorosa_X_act.npy")
+    output_data_V_act = os.path.join(output_dir, "vettori_rumorosi_V_act.npy")
+
+    trajectory_array = np.array(trajectory_X_act)
+    vectors_array = np.array(vectors_V_act)
+
+    np.save(output_data_X_act, trajectory_array)
+    np.save(output_data_V_act, vectors_array)
+
+    print(f"Salvati {trajectory_array.shape} dati in: {output_data_X_act}")
+    print(f"Salvati {vectors_array.shape} dati in: {output_data_V_act}")
+    return output_data_X_act, output_data_V_act
+
+def _track_dense(prev_gray, prev_points, grays):
+    """
+    Tracciamento frame per frame (come run_phase1) sui frame in grays,
+    partendo da prev_gray/prev_points.
+    Ritorna la lista dei vettori (dx, dy, d_theta), uno per frame, e i punti finali.
+    """
+    vectors = []
+    for curr_gray in grays:
+        dx, dy, d_theta = 0.0, 0.0, 0.0
+        curr_points = None
+        if prev_points is not None and len(prev_points) > 0:
+            curr_points, status, err = cv2.calcOpticalFlowPyrLK(prev_gray, curr_gray, prev_points, None)
+
+        if curr_points is not None:
+            good_new = curr_points[status == 1]
+        else:
+            good_new = np.array([])
+
+        if len(good_new) < 50:
+            # TRACCIAMENTO FALLITO - si cercano nuovi punti
+            prev_points = _detect_points(curr_gray)
+        else:
+            good_old = prev_points[status == 1]
+            dx, dy, d_theta = _estimate_motion(good_old, good_new)
+            prev_points = good_new.reshape(-1, 1, 2)
+
+        vectors.append((dx, dy, d_theta))
+        prev_gray = curr_gray
+    return vectors, prev_points
+
+def _trajectory_error(X_ref, X_test):
+    """
+    Errore punto per punto tra due traiettorie X_act (accumulate).
+    Ritorna un dizionario con errore massimo e RMS per x, y (pixel) e theta (rad).
+    """
+    min_len = min(len(X_ref), len(X_test))
+    diff = np.abs(np.asarray(X_ref)[:min_len] - np.asarray(X_test)[:min_len])
+
+    errors = {}
+    for i, axis in enumerate(["x", "y", "theta"]):
+        errors[f"max_{axis}"] = float(np.max(diff[:, i]))
+        errors[f"rms_{axis}"] = float(np.sqrt(np.mean(diff[:, i] ** 2)))
+    print(f"Errore traiettoria: max x={errors['max_x']:.2f}, max y={errors['max_y']:.2f}, "
+          f"max theta={errors['max_theta']:.4f}")
+    return errors
+
+def _track_keyframe_segment(key_gray, key_points, grays, max_motion, max_rotation, max_residual):
+    """
+    Stima il moto tra il keyframe e l'ultimo frame di grays con un solo tracciamento.
+    Se il moto per frame è piccolo e i residui sono sotto max_residual, i vettori
+    per frame vengono interpolati linearmente, dopo una verifica sul frame centrale.
+
+    Ritorna (vettori interpolati, residuo della verifica, inlier tracciati nell'ultimo frame)
+    oppure (None, None, None) se è necessario il tracciamento denso.
+    """
+    n = len(grays)
+    if key_points is None or len(key_points) < 50:
+        return None, None, None
+
+    # Tracciamento diretto keyframe -> ultimo frame
+    last_points, status, err = cv2.calcOpticalFlowPyrLK(key_gray, grays[-1], key_points, None)
+    if last_points is None:
+        return None, None, None
+    status = status.ravel() == 1
+    if np.count_nonzero(status) < 50:
+        return None, None, None
+
+    good_old = key_points[status].reshape(-1, 2)
+    good_new = last_points[status].reshape(-1, 2)
+    m, inliers = cv2.estimateAffinePartial2D(good_old, good_new, ransacReprojThreshold=3)
+    if m is None:
+        return None, None, None
+
+    dx, dy, d_theta = m[0, 2], m[1, 2], np.arctan2(m[1, 0], m[0, 0])
+
+    # Il segmento è interpolabile solo se il moto per frame è piccolo
+    if np.hypot(dx, dy) / n > max_motion or abs(d_theta) / n > max_rotation:
+        return None, None, None
+
+    # Residuo della stima RANSAC sugli inlier
+    inliers = inliers.ravel() == 1
+    inlier_old = good_old[inliers]
+    projected = inlier_old @ m[:, :2].T + m[:, 2]
+    if np.median(np.linalg.norm(projected - good_new[inliers], axis=1)) > max_residual:
+        return None, None, None
+
+    residual = 0.0
+    if n > 1:
+        # Verifica economica: traccia solo gli inlier fino al frame centrale
+        # e li confronta con la posizione prevista dal moto interpolato
+        mid = n // 2
+        frac = mid / n
+        mid_points, mid_status, _ = cv2.calcOpticalFlowPyrLK(
+            key_gray, grays[mid - 1], inlier_old.reshape(-1, 1, 2).astype(np.float32), None
+        )
+        if mid_points is None:
+            return None, None, None
+        mid_status = mid_status.ravel() == 1
+        if np.count_nonzero(mid_status) < 10:
+            return None, None, None
+
+        theta_f = d_theta * frac
+        R_f = np.array([[np.cos(theta_f), -np.sin(theta_f)],
+                        [np.sin(theta_f), np.cos(theta_f)]])
+        predicted = inlier_old[mid_status] @ R_f.T + np.array([dx, dy]) * frac
+        residual = np.median(np.linalg.norm(predicted - mid_points.reshape(-1, 2)[mid_status], axis=1))
+        if residual > max_residual:
+            return None, None, None
+
+    last_inliers = good_new[inliers].reshape(-1, 1, 2).astype(np.float32)
+    return [(dx / n, dy / n, d_theta / n)] * n, residual, last_inliers
+
+# --- Funzioni Principali ---
+
 def run_phase1(video_file_path, output_dir, video_name_base):
     """
     Esegue la Fase 1: Estrazione Feature e Calcolo Traiettoria.
@@ -12,8 +173,6 @@ def run_phase1(video_file_path, output_dir, video_name_base):
     print(f"--- Avvio Fase 1: Estrazione Feature per {video_file_path} ---")
     
     output_video_file = os.path.join(output_dir, f"{video_name_base}_with_points.mp4")
-    output_data_X_act = os.path.join(output_dir, "traiettoria_rumorosa_X_act.npy")
-    output_data_V_act = os.path.join(output_dir, "vettori_rumorosi_V_act.npy")
 
     if not os.path.exists(output_dir):
         os.makedirs(output_dir)
@@ -41,11 +200,7 @@ def run_phase1(video_file_path, output_dir, video_name_base):
     prev_gray = cv2.cvtColor(prev_frame, cv2.COLOR_BGR2GRAY)
 
     # Rileva punti di interesse nel primo frame
-    MAX_PUNTI = 200 
-    prev_points = cv2.goodFeaturesToTrack(
-        prev_gray, maxCorners=MAX_PUNTI, qualityLevel=0.1,
-        minDistance=7, blockSize=7
-    )
+    prev_points = _detect_points(prev_gray)
     if prev_points is None:
         print("ERRORE: Nessun punto trovato nel primo frame.")
         cap.release()
@@ -83,10 +238,7 @@ def run_phase1(video_file_path, output_dir, video_name_base):
         if len(good_new) < 50:
             # TRACCIAMENTO FALLITO - si cercano nuovi punti
             print(f"Attenzione: Tracciamento fallito al frame {frame_count}. Riavvio dei punti.")
-            new_points = cv2.goodFeaturesToTrack(
-                curr_gray, maxCorners=MAX_PUNTI, qualityLevel=0.1,
-                minDistance=7, blockSize=7
-            )
+            new_points = _detect_points(curr_gray)
             prev_points = new_points
             
             if new_points is not None:
@@ -105,11 +257,7 @@ def run_phase1(video_file_path, output_dir, video_name_base):
                                markerSize=5, thickness=1)
             
             # Stima la trasformazione affine tra i punti vecchi e nuovi
-            m, _ = cv2.estimateAffinePartial2D(good_old, good_new, ransacReprojThreshold=3)
-            if m is not None:
-                dx = m[0, 2]
-                dy = m[1, 2]
-                d_theta = np.arctan2(m[1, 0], m[0, 0])
+            dx, dy, d_theta = _estimate_motion(good_old, good_new)
             
             prev_points = good_new.reshape(-1, 1, 2)
         
@@ -117,28 +265,145 @@ def run_phase1(video_file_path, output_dir, video_name_base):
         
         # Aggiorna traiettoria e vettori
         vectors_V_act.append((dx, dy, d_theta))
-        
-        last_x, last_y, last_theta = trajectory_X_act[-1]
-        new_theta = last_theta + d_theta
-        new_x = last_x + (dx * np.cos(last_theta) - dy * np.sin(last_theta))
-        new_y = last_y + (dx * np.sin(last_theta) + dy * np.cos(last_theta))
-        trajectory_X_act.append((new_x, new_y, new_theta))
+        _accumulate(trajectory_X_act, dx, dy, d_theta)
         
         prev_gray = curr_gray.copy()
 
     print(f"Fase 1 completata. Processati {frame_count} frame.")
     
-    trajectory_array = np.array(trajectory_X_act)
-    vectors_array = np.array(vectors_V_act)
-    
-    np.save(output_data_X_act, trajectory_array)
-    np.save(output_data_V_act, vectors_array)
-
-    print(f"Salvati {trajectory_array.shape} dati in: {output_data_X_act}")
-    print(f"Salvati {vectors_array.shape} dati in: {output_data_V_act}")
+    output_data_X_act, output_data_V_act = _save_results(output_dir, trajectory_X_act, vectors_V_act)
     
     cap.release()
     out.release() 
     cv2.destroyAllWindows()
     
-    return output_data_X_act, output_data_V_act
\ No newline at end of file
+    return output_data_X_act, output_data_V_act
+
+def run_phase1_sparse(video_file_path, output_dir, video_name_base, keyframe_interval=10,
+                      max_motion=2.0, max_rotation=0.002, max_residual=1.0, verify_dense=False, stats=None):
+    """
+    Variante della Fase 1 con stima del moto su keyframe, pensata per riprese quasi statiche.
+    Ogni keyframe_interval frame si stima il moto rispetto al keyframe precedente:
+    se il moto per frame è sotto max_motion (pixel) e max_rotation (rad) e i residui
+    sono sotto max_residual (pixel), i vettori V_act intermedi vengono interpolati.
+    Altrimenti il segmento viene tracciato frame per frame come in run_phase1.
+
+    Il residuo di verifica vale per il singolo segmento: gli errori di interpolazione
+    si accumulano in X_act. Con verify_dense=True viene calcolata in parallelo anche la
+    traiettoria densa (come run_phase1) e riportato l'errore accumulato misurato,
+    al costo del tracciamento completo. Se stats è un dizionario, vi vengono scritte
+    le statistiche dell'esecuzione (ed eventualmente gli errori).
+
+    Il video con i punti tracciati non viene generato.
+    Ritorna i percorsi ai due file di dati.
+    """
+    print(f"--- Avvio Fase 1 (Keyframe, intervallo {keyframe_interval}): Estrazione Feature per {video_file_path} ---")
+
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+
+    cap = cv2.VideoCapture(video_file_path)
+    if not cap.isOpened():
+        print(f"ERRORE: Impossibile aprire {video_file_path}")
+        return None, None
+
+    # Leggi il primo frame (primo keyframe)
+    ret, key_frame = cap.read()
+    if not ret:
+        print("ERRORE: Impossibile leggere il primo frame.")
+        cap.release()
+        return None, None
+
+    key_gray = cv2.cvtColor(key_frame, cv2.COLOR_BGR2GRAY)
+    key_points = _detect_points(key_gray)
+    if key_points is None:
+        print("ERRORE: Nessun punto trovato nel primo frame.")
+        cap.release()
+        return None, None
+
+    print(f"Trovati {len(key_points)} punti iniziali da tracciare.")
+
+    trajectory_X_act = [(0.0, 0.0, 0.0)] # Traiettoria accumulata
+    vectors_V_act = [(0.0, 0.0, 0.0)]    # Vettori (V_act(n))
+    frame_count = 0
+    sparse_frames = 0   # Frame con moto interpolato
+    max_accepted = 0.0  # Residuo massimo accettato in verifica (per segmento)
+
+    # Traiettoria densa di riferimento, tracciata senza interruzioni tra i segmenti
+    reference_X_act = [(0.0, 0.0, 0.0)]
+    ref_gray, ref_points = key_gray, key_points
+
+    buffer = [] # Frame (grigi) dopo il keyframe corrente
+    while True:
+        ret, curr_frame = cap.read()
+        if ret:
+            frame_count += 1
+            buffer.append(cv2.cvtColor(curr_frame, cv2.COLOR_BGR2GRAY))
+            if len(buffer) < keyframe_interval:
+                continue
+        elif len(buffer) == 0:
+            print("Fine del video.")
+            break
+
+        # Fine del segmento: stima sparsa, con ripiego sul tracciamento denso
+        vectors, residual, tracked_points = _track_keyframe_segment(key_gray, key_points, buffer,
+                                                                    max_motion, max_rotation, max_residual)
+        if vectors is None:
+            vectors, tracked_points = _track_dense(key_gray, key_points, buffer)
+        else:
+            sparse_frames += len(buffer)
+            max_accepted = max(max_accepted, residual)
+
+        for dx, dy, d_theta in vectors:
+            vectors_V_act.append((dx, dy, d_theta))
+            _accumulate(trajectory_X_act, dx, dy, d_theta)
+
+        if verify_dense:
+            ref_vectors, ref_points = _track_dense(ref_gray, ref_points, buffer)
+            ref_gray = buffer[-1]
+            for dx, dy, d_theta in ref_vectors:
+                _accumulate(reference_X_act, dx, dy, d_theta)
+
+        # L'ultimo frame del segmento diventa il nuovo keyframe
+        key_gray = buffer[-1]
+        # I punti tracciati passano al nuovo keyframe; si rilevano di nuovo solo
+        # se ne sopravvivono meno di 50, come in run_phase1
+        if tracked_points is None or len(tracked_points) < 50:
+            key_points = _detect_points(key_gray)
+        else:
+            key_points = tracked_points
+        buffer = []
+
+        if not ret:
+            print("Fine del video.")
+            break
+
+    print(f"Fase 1 (Keyframe) completata. Processati {frame_count} frame.")
+    if frame_count > 0:
+        print(f"  Frame interpolati: {sparse_frames} ({sparse_frames / frame_count * 100:.1f}%)")
+    print(f"  Residuo massimo di verifica (singolo segmento, non cumulativo): {max_accepted:.3f} pixel")
+
+    errors = None
+    if verify_dense:
+        print("Confronto con il tracciamento denso:")
+        errors = _trajectory_error(reference_X_act, trajectory_X_act)
+
+    if stats is not None:
+        stats.update({
+            "frames": frame_count,
+            "sparse_frames": sparse_frames,
+            "max_segment_residual": max_accepted,
+            "errors": errors,
+        })
+
+    output_data_X_act, output_data_V_act = _save_results(output_dir, trajectory_X_act, vectors_V_act)
+
+    cap.release()
+    return output_data_X_act, output_data_V_act
+
+def measure_trajectory_error(x_ref_path, x_test_path):
+    """
+    Confronta due traiettorie X_act (es. densa e a keyframe).
+    Ritorna un dizionario con errore massimo e RMS per x, y (pixel) e theta (rad).
+    """
+    return _trajectory_error(np.load(x_ref_path), np.load(x_test_path))
@@ -0,0 +1,369 @@
+import cv2
+import numpy as np
+import os
+import queue
+import tempfile
+import threading
+import time
+
+from phase1_extract import _detect_points, _estimate_motion, _accumulate, _save_results
+
+# --- Sorgente di Frame ---
+
+class FrameSource:
+    """
+    Sorgente di frame con coda limitata, alimentata da un thread di lettura dedicato.
+    Accetta un indice di camera o un file video: con realtime=True il file viene
+    letto al suo frame rate, simulando una camera.
+
+    In modalità live, se la coda è piena viene scartato il frame più vecchio.
+    Ogni frame porta con sé il proprio indice, così i frame scartati restano visibili a valle,
+    e l'istante di acquisizione, da cui si misura il ritardo di elaborazione.
+    """
+    def __init__(self, source, queue_size=4, realtime=True):
+        self.cap = cv2.VideoCapture(source)
+        self.is_file = isinstance(source, str) and os.path.isfile(source)
+        self.realtime = realtime
+        self.fps = self.cap.get(cv2.CAP_PROP_FPS) or 30.0
+        self.frame_width = int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+        self.frame_height = int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.frames_read = 0 # Frame letti dalla sorgente
+        self.dropped = 0     # Frame scartati per coda piena
+        self._stop = threading.Event()
+        self._thread = None
+
+    def isOpened(self):
+        return self.cap.isOpened()
+
+    @property
+    def live(self):
+        # Un file letto offline non ha scadenze: la lettura attende l'elaborazione
+        return not (self.is_file and not self.realtime)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._reader, daemon=True)
+        self._thread.start()
+        return self
+
+    def _reader(self):
+        period = 1.0 / self.fps
+        next_time = time.perf_counter()
+        while not self._stop.is_set():
+            ret, frame = self.cap.read()
+            if not ret:
+                break
+
+            if self.is_file and self.realtime:
+                # Cadenza il file al frame rate della sorgente
+                next_time += period
+                delay = next_time - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+
+            self._put((self.frames_read, frame, time.perf_counter()))
+            self.frames_read += 1
+        self._put(None) # Fine della sorgente
+
+    def _put(self, item):
+        # Un file letto offline non perde frame: si attende che la coda si liberi
+        if not self.live:
+            self.queue.put(item)
+            return
+
+        while True:
+            try:
+                self.queue.put_nowait(item)
+                return
+            except queue.Full:
+                try:
+                    self.queue.get_nowait()
+                    self.dropped += 1
+                except queue.Empty:
+                    pass
+
+    def read(self):
+        """
+        Ritorna (ret, indice, frame, istante di acquisizione); ret è False a fine sorgente.
+        """
+        item = self.queue.get()
+        if item is None:
+            return False, None, None, None
+        return True, item[0], item[1], item[2]
+
+    def release(self):
+        self._stop.set()
+        # Svuota la coda per sbloccare un eventuale put in attesa
+        while self._thread is not None and self._thread.is_alive():
+            try:
+                self.queue.get_nowait()
+            except queue.Empty:
+                pass
+            self._thread.join(timeout=0.05)
+        self.cap.release()
+
+# --- Controllore Adattivo ---
+
+# Livelli di qualità, dal più costoso al più economico.
+# Il livello 0 corrisponde ai parametri di run_phase1 (default di calcOpticalFlowPyrLK).
+QUALITY_LEVELS = [
+    {"max_points": 200, "max_level": 3, "win_size": 21, "scale": 1.0},
+    {"max_points": 150, "max_level": 3, "win_size": 21, "scale": 0.75},
+    {"max_points": 100, "max_level": 2, "win_size": 15, "scale": 0.5},
+    {"max_points": 60,  "max_level": 2, "win_size": 11, "scale": 0.5},
+    {"max_points": 40,  "max_level": 1, "win_size": 9,  "scale": 0.25},
+]
+
+class AdaptiveTrackingController:
+    """
+    Confronta il tempo di elaborazione per frame (media mobile esponenziale)
+    con il budget per frame e sceglie il livello di qualità del tracciamento.
+
+    - Media sopra downgrade_ratio * budget: si scende di un livello.
+    - Media sotto upgrade_ratio * budget per upgrade_patience frame: si sale di un livello.
+    - Frame acquisito da oltre un budget: il frame viene saltato (moto interpolato).
+    """
+    def __init__(self, frame_budget, levels=QUALITY_LEVELS, ema_alpha=0.2,
+                 downgrade_ratio=0.9, upgrade_ratio=0.5, upgrade_patience=30, max_consecutive_skips=5):
+        self.frame_budget = frame_budget
+        self.levels = levels
+        self.ema_alpha = ema_alpha
+        self.downgrade_ratio = downgrade_ratio
+        self.upgrade_ratio = upgrade_ratio
+        self.upgrade_patience = upgrade_patience
+        self.max_consecutive_skips = max_consecutive_skips
+
+        self.level = 0
+        self.avg_time = None
+        self._fast_frames = 0
+        self._consecutive_skips = 0
+
+    @property
+    def params(self):
+        return self.levels[self.level]
+
+    def should_skip(self, lag):
+        # Salta il frame se attende da oltre un budget, ma non troppi di fila
+        if lag > self.frame_budget and self._consecutive_skips < self.max_consecutive_skips:
+            self._consecutive_skips += 1
+            return True
+        self._consecutive_skips = 0
+        return False
+
+    def update(self, elapsed):
+        """
+        Registra il tempo di elaborazione di un frame.
+        Ritorna True se il livello di qualità è cambiato.
+        """
+        if self.avg_time is None:
+            self.avg_time = elapsed
+        else:
+            self.avg_time = self.ema_alpha * elapsed + (1 - self.ema_alpha) * self.avg_time
+
+        if self.avg_time > self.downgrade_ratio * self.frame_budget and self.level < len(self.levels) - 1:
+            self.level += 1
+            self._fast_frames = 0
+            self.avg_time = None # Nuova misura per il nuovo livello
+            return True
+
+        if self.avg_time < self.upgrade_ratio * self.frame_budget and self.level > 0:
+            self._fast_frames += 1
+            if self._fast_frames >= self.upgrade_patience:
+                self.level -= 1
+                self._fast_frames = 0
+                self.avg_time = None
+                return True
+        else:
+            self._fast_frames = 0
+        return False
+
+# --- Funzioni Helper Interne ---
+
+def _prepare_gray(frame, scale):
+    # Conversione in scala di grigi e riduzione alla scala di analisi
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    if scale != 1.0:
+        gray = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    return gray
+
+def _append_motion(trajectory_X_act, vectors_V_act, dx, dy, d_theta, n_steps):
+    # Distribuisce il moto misurato in parti uguali sui frame saltati o scartati
+    for _ in range(n_steps):
+        vectors_V_act.append((dx / n_steps, dy / n_steps, d_theta / n_steps))
+        _accumulate(trajectory_X_act, dx / n_steps, dy / n_steps, d_theta / n_steps)
+
+# --- Funzioni Principali ---
+
+def run_phase1_live(source, output_dir, video_name_base, target_fps=None, queue_size=4, realtime=True, stats=None):
+    """
+    Variante della Fase 1 per sorgenti live (camera o file cadenzato).
+    Un controllore adattivo mantiene il tempo di elaborazione entro il budget per frame
+    variando numero di punti, livelli della piramide LK, finestra e scala di analisi;
+    i frame saltati o scartati ricevono il moto interpolato.
+
+    Salva X_act e V_act come run_phase1 (un elemento per frame della sorgente).
+    Se stats è un dizionario, vi vengono scritte le statistiche dell'esecuzione.
+    Ritorna i percorsi ai due file di dati.
+    """
+    print(f"--- Avvio Fase 1 (Live): Estrazione Feature per {source} ---")
+
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+
+    frame_source = FrameSource(source, queue_size=queue_size, realtime=realtime)
+    if not frame_source.isOpened():
+        print(f"ERRORE: Impossibile aprire {source}")
+        return None, None
+
+    fps = target_fps or frame_source.fps
+    controller = AdaptiveTrackingController(frame_budget=1.0 / fps)
+    print(f"Budget per frame: {controller.frame_budget * 1000:.1f} ms ({fps:.2f} fps)")
+
+    frame_source.start()
+
+    # Leggi il primo frame
+    ret, first_idx, prev_frame, _ = frame_source.read()
+    if not ret:
+        print("ERRORE: Impossibile leggere il primo frame.")
+        frame_source.release()
+        return None, None
+
+    params = controller.params
+    prev_gray = _prepare_gray(prev_frame, params["scale"])
+    prev_points = _detect_points(prev_gray, params["max_points"])
+    if prev_points is None:
+        print("ERRORE: Nessun punto trovato nel primo frame.")
+        frame_source.release()
+        return None, None
+
+    print(f"Trovati {len(prev_points)} punti iniziali da tracciare.")
+
+    # Frame persi prima del primo letto: moto sconosciuto, considerato nullo
+    trajectory_X_act = [(0.0, 0.0, 0.0)] * (first_idx + 1)
+    vectors_V_act = [(0.0, 0.0, 0.0)] * (first_idx + 1)
+    last_idx = first_idx
+
+    processed_count = 0
+    skipped_count = 0
+    total_time = 0.0
+
+    # Ciclo sui frame della sorgente
+    while True:
+        ret, frame_idx, curr_frame, capture_time = frame_source.read()
+        if not ret:
+            print("Fine della sorgente.")
+            break
+
+        # Ritardo: tempo trascorso dall'acquisizione del frame (nessuna scadenza offline)
+        lag = time.perf_counter() - capture_time if frame_source.live else 0.0
+        if controller.should_skip(lag):
+            skipped_count += 1
+            continue
+
+        t0 = time.perf_counter()
+        params = controller.params
+        scale = params["scale"]
+        min_good = max(8, params["max_points"] // 4)
+
+        curr_gray = _prepare_gray(curr_frame, scale)
+        dx, dy, d_theta = 0.0, 0.0, 0.0
+
+        # Calcola il flusso ottico con i parametri del livello corrente
+        curr_points = None
+        if len(prev_points) > 0:
+            curr_points, status, err = cv2.calcOpticalFlowPyrLK(
+                prev_gray, curr_gray, prev_points, None,
+                winSize=(params["win_size"], params["win_size"]), maxLevel=params["max_level"]
+            )
+
+        if curr_points is not None:
+            good_new = curr_points[status == 1]
+        else:
+            good_new = np.array([])
+
+        if len(good_new) < min_good:
+            # TRACCIAMENTO FALLITO - si cercano nuovi punti
+            print(f"Attenzione: Tracciamento fallito al frame {frame_idx}. Riavvio dei punti.")
+            prev_points = _detect_points(curr_gray, params["max_points"])
+        else:
+            # TRACCIAMENTO RIUSCITO
+            good_old = prev_points[status == 1]
+            dx, dy, d_theta = _estimate_motion(good_old, good_new)
+            # Riporta la traslazione alla risoluzione originale
+            dx, dy = dx / scale, dy / scale
+            prev_points = good_new.reshape(-1, 1, 2)
+
+        _append_motion(trajectory_X_act, vectors_V_act, dx, dy, d_theta, frame_idx - last_idx)
+        last_idx = frame_idx
+        prev_gray = curr_gray
+
+        elapsed = time.perf_counter() - t0
+        total_time += elapsed
+        processed_count += 1
+
+        if controller.update(elapsed):
+            # Nuovo livello: riporta il frame di riferimento alla nuova scala e rileva di nuovo i punti
+            params = controller.params
+            print(f"Livello di qualità {controller.level} al frame {frame_idx}: {params}")
+            prev_gray = _prepare_gray(curr_frame, params["scale"])
+            new_points = _detect_points(prev_gray, params["max_points"])
+            if new_points is not None:
+                prev_points = new_points
+
+        if prev_points is None or len(prev_points) == 0:
+            prev_points = _detect_points(prev_gray, controller.params["max_points"])
+            if prev_points is None:
+                # Nessun punto nemmeno dopo il riavvio: si riprova al frame successivo
+                prev_points = np.empty((0, 1, 2), dtype=np.float32)
+
+    frame_source.release()
+
+    # Frame persi in coda alla sorgente: moto sconosciuto, considerato nullo
+    for _ in range(frame_source.frames_read - 1 - last_idx):
+        vectors_V_act.append((0.0, 0.0, 0.0))
+        _accumulate(trajectory_X_act, 0.0, 0.0, 0.0)
+
+    print(f"Fase 1 (Live) completata. Elaborati {processed_count} frame su {frame_source.frames_read}.")
+    print(f"  Frame saltati dal controllore: {skipped_count}")
+    print(f"  Frame scartati dalla sorgente: {frame_source.dropped}")
+    if processed_count > 0:
+        print(f"  Tempo medio per frame: {total_time / processed_count * 1000:.1f} ms")
+    print(f"  Livello di qualità finale: {controller.level}")
+
+    if stats is not None:
+        stats.update({
+            "frames_read": frame_source.frames_read,
+            "processed": processed_count,
+            "skipped": skipped_count,
+            "dropped": frame_source.dropped,
+            "avg_time": total_time / processed_count if processed_count > 0 else 0.0,
+            "level": controller.level,
+        })
+
+    return _save_results(output_dir, trajectory_X_act, vectors_V_act)
+
+def check_paced_file(video_path, target_fps=1.0):
+    """
+    Verifica del controllore con un file cadenzato al posto della camera:
+    con un budget ampio (target_fps basso) nessun frame deve essere saltato o scartato.
+    Ritorna True se la verifica è superata.
+    """
+    stats = {}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        x_act_path, _ = run_phase1_live(video_path, tmp_dir, "check", target_fps=target_fps, stats=stats)
+        if x_act_path is None:
+            return False
+        n_frames = len(np.load(x_act_path))
+
+    ok = stats["skipped"] == 0 and stats["dropped"] == 0 and n_frames == stats["frames_read"]
+    print(f"Verifica file cadenzato: {'OK' if ok else 'FALLITA'} "
+          f"(saltati {stats['skipped']}, scartati {stats['dropped']}, {n_frames}/{stats['frames_read']} frame)")
+    return ok
+
+if __name__ == "__main__":
+    import sys
+    if len(sys.argv) != 2:
+        print("Uso: python phase1_live.py path/to/video.mp4")
+        sys.exit(1)
+    sys.exit(0 if check_paced_file(sys.argv[1]) else 1)
@@ -0,0 +1,153 @@
+import numpy as np
+import cv2
+
+# --- Calibrazione ---
+
+def load_camera_calibration(calibration_path):
+    """
+    Carica la calibrazione della camera da un file .npz
+    con chiavi "camera_matrix" (3x3) e "dist_coeffs".
+    Ritorna (camera_matrix, dist_coeffs) oppure (None, None) se il file non esiste
+    o non contiene le chiavi richieste.
+    """
+    try:
+        data = np.load(calibration_path)
+    except FileNotFoundError:
+        print(f"ERRORE (Fase 3): File di calibrazione non trovato {calibration_path}")
+        return None, None
+
+    try:
+        return data["camera_matrix"], data["dist_coeffs"]
+    except KeyError as e:
+        print(f"ERRORE (Fase 3): Chiave {e} mancante nel file di calibrazione {calibration_path}")
+        return None, None
+
+# --- Motore di Warp ---
+
+class RemapWarper:
+    """
+    Applica in un solo cv2.remap per frame:
+    - correzione di stabilizzazione e zoom (come _build_warp_matrix),
+    - correzione rolling shutter: ogni riga usa la posizione della camera
+      interpolata dalla traiettoria X_act all'istante di acquisizione della riga,
+    - rimozione della distorsione della lente, tramite una griglia base calcolata una volta.
+
+    rolling_shutter è il tempo di lettura del sensore come frazione del periodo di frame
+    (0 = global shutter). La riga centrale è il riferimento temporale del frame.
+
+    Le mappe restano in float32: ognuna è usata una sola volta, e la conversione in
+    virgola fissa (fixed_point=True) costerebbe un passaggio in più sull'intero frame.
+    """
+    def __init__(self, frame_width, frame_height, trajectory_X_act, camera_matrix=None, dist_coeffs=None,
+                 rolling_shutter=0.0, fixed_point=False):
+        self.frame_width = frame_width
+        self.frame_height = frame_height
+        self.rolling_shutter = rolling_shutter
+        self.fixed_point = fixed_point
+
+        # Velocità della camera per frame (differenze centrali su X_act)
+        trajectory_X_act = np.asarray(trajectory_X_act, dtype=np.float64)
+        if len(trajectory_X_act) > 1:
+            self.velocity = np.gradient(trajectory_X_act, axis=0).astype(np.float32)
+        else:
+            self.velocity = np.zeros_like(trajectory_X_act, dtype=np.float32)
+
+        # Griglia dei pixel di output, riusata per ogni frame
+        self.xs = np.arange(frame_width, dtype=np.float32)[None, :]
+        self.ys = np.arange(frame_height, dtype=np.float32)[:, None]
+
+        # Griglia base di undistorsione: coordinate non distorte -> coordinate nel frame sorgente
+        self.base_map = None
+        if camera_matrix is not None:
+            new_camera_matrix, _ = cv2.getOptimalNewCameraMatrix(
+                camera_matrix, dist_coeffs, (frame_width, frame_height), 0
+            )
+            self.base_map, _ = cv2.initUndistortRectifyMap(
+                camera_matrix, dist_coeffs, None, new_camera_matrix,
+                (frame_width, frame_height), cv2.CV_32FC2
+            )
+
+    def rolling_shutter_margin(self):
+        """
+        Spostamento aggiuntivo massimo (x, y) per frame dovuto al rolling shutter:
+        le righe estreme distano mezzo tempo di lettura dalla riga centrale.
+        Ritorna due array, un elemento per frame di X_act.
+        """
+        margin = 0.5 * abs(self.rolling_shutter) * np.abs(self.velocity)
+        return margin[:, 0], margin[:, 1]
+
+    def build_map(self, frame_idx, dx, dy, d_theta, M_zoom):
+        """
+        Costruisce la mappa (output -> sorgente) del frame frame_idx.
+        Ritorna la coppia (map1, map2) da passare a cv2.remap.
+        """
+        zoom = M_zoom[0, 0]
+
+        # Correzione per riga: la riga acquisita più tardi ha visto la camera più avanti
+        if self.rolling_shutter != 0.0 and frame_idx < len(self.velocity):
+            vx, vy, vtheta = self.velocity[frame_idx]
+            # L'istante di lettura dipende dalla riga del sensore da cui si campiona,
+            # non dalla riga di output: si usa la riga sorgente senza rolling shutter
+            source_rows = (self.ys - M_zoom[1, 2]) / zoom - np.float32(dy)
+            row_offset = (source_rows / self.frame_height - 0.5) * np.float32(self.rolling_shutter)
+            dx_row = np.float32(dx) - row_offset * vx
+            dy_row = np.float32(dy) - row_offset * vy
+            theta_row = np.float32(d_theta) - row_offset * vtheta
+        else:
+            dx_row, dy_row, theta_row = np.float32(dx), np.float32(dy), np.float32(d_theta)
+
+        # Inversa di zoom e stabilizzazione: sorgente = R(-theta) * ((p - t_zoom) / z - t)
+        u = (self.xs - M_zoom[0, 2]) / zoom - dx_row
+        v = (self.ys - M_zoom[1, 2]) / zoom - dy_row
+        c = np.cos(theta_row)
+        s = np.sin(theta_row)
+        map_x = c * u + s * v
+        map_y = c * v - s * u
+
+        if self.base_map is not None:
+            # Composizione con la griglia di undistorsione (fuori dal frame -> nero)
+            combined = cv2.remap(self.base_map, map_x, map_y, cv2.INTER_LINEAR,
+                                 borderMode=cv2.BORDER_CONSTANT, borderValue=(-1, -1))
+            if self.fixed_point:
+                return cv2.convertMaps(combined, None, cv2.CV_16SC2)
+            return combined, None
+
+        if self.fixed_point:
+            return cv2.convertMaps(map_x, map_y, cv2.CV_16SC2)
+        return map_x, map_y
+
+    def warp(self, frame, frame_idx, dx, dy, d_theta, M_zoom):
+        map1, map2 = self.build_map(frame_idx, dx, dy, d_theta, M_zoom)
+        return cv2.remap(frame, map1, map2, cv2.INTER_LINEAR, borderMode=cv2.BORDER_CONSTANT)
+
+# --- Funzioni Principali ---
+
+def create_remap_warper(video_input_path, x_act_path, calibration_path=None, rolling_shutter=0.0, fixed_point=False):
+    """
+    Crea un RemapWarper per il video e la traiettoria indicati.
+    Ritorna None in caso di errore.
+    """
+    cap = cv2.VideoCapture(video_input_path)
+    if not cap.isOpened():
+        print(f"ERRORE (Fase 3): Impossibile aprire {video_input_path}")
+        return None
+    frame_width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+    frame_height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    cap.release()
+
+    try:
+        X_act = np.load(x_act_path)
+    except FileNotFoundError:
+        print(f"ERRORE (Fase 3): File non trovato {x_act_path}")
+        return None
+
+    camera_matrix, dist_coeffs = None, None
+    if calibration_path is not None:
+        camera_matrix, dist_coeffs = load_camera_calibration(calibration_path)
+        if camera_matrix is None:
+            return None
+
+    print(f"Motore di warp remap: undistorsione={'sì' if camera_matrix is not None else 'no'}, "
+          f"rolling shutter={rolling_shutter}, virgola fissa={'sì' if fixed_point else 'no'}")
+    return RemapWarper(frame_width, frame_height, X_act, camera_matrix, dist_coeffs,
+                       rolling_shutter=rolling_shutter, fixed_point=fixed_point)
@@ -1,20 +1,18 @@
 import numpy as np
 import cv2
 import os
+import shutil
+import subprocess
+import tempfile
+import multiprocessing
 
-def run_phase3(video_input_path, x_act_path, x_smooth_path, output_video_path, trim_config={}):
+# --- Funzioni Helper Interne ---
+
+def _load_corrections(x_act_path, x_smooth_path):
     """
-    Esegue la Fase 3: Stabilizzazione, Cropping e Trimming.
-    Crea il video finale stabilizzato.
-    
-    Ritorna True se ha successo, False altrimenti.
+    Carica X_act e X_smooth e calcola le correzioni (dx, dy, dtheta) per frame.
+    Ritorna None se i file non esistono.
     """
-    print(f"--- Avvio Fase 3: Stabilizzazione per {output_video_path} ---")
-    
-    # Trimming
-    TRIM_START_FRAMES = trim_config.get("start", 0)
-    TRIM_END_FRAMES = trim_config.get("end", 0)
-
     try:
         X_act = np.load(x_act_path)
         X_smooth = np.load(x_smooth_path)
@@ -23,28 +21,8 @@ def run_phase3(video_input_path, x_act_path, x_smooth_path, output_video_path, t
         print("File traiettoria non trovati. Controllare i percorsi:")
         print(f"  X_act: {x_act_path}")
         print(f"  X_smooth: {x_smooth_path}")
-        return False
-
-    cap = cv2.VideoCapture(video_input_path)
-    if not cap.isOpened():
-        print(f"ERRORE (Fase 3): Impossibile aprire {video_input_path}")
-        return False
-
-    # Informazioni video
-    frame_width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-    frame_height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-    fps = cap.get(cv2.CAP_PROP_FPS)
-    fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-    
-    output_dir = os.path.dirname(output_video_path)
-    if not os.path.exists(output_dir) and output_dir != '':
-        os.makedirs(output_dir)
-        
-    out = cv2.VideoWriter(output_video_path, fourcc, fps, (frame_width, frame_height))
-
-    print(f"Dimensioni video: {frame_width}x{frame_height}")
+        return None
 
-    # Calcolo dei bordi da nascondere
     min_len = min(len(X_act), len(X_smooth))
     X_act_sync = X_act[:min_len]
     X_smooth_sync = X_smooth[:min_len]
@@ -52,28 +30,38 @@ def run_phase3(video_input_path, x_act_path, x_smooth_path, output_video_path, t
     dx_corr = X_smooth_sync[:, 0] - X_act_sync[:, 0]
     dy_corr = X_smooth_sync[:, 1] - X_act_sync[:, 1]
     d_theta_corr = X_smooth_sync[:, 2] - X_act_sync[:, 2]
+    return dx_corr, dy_corr, d_theta_corr
 
-    start_idx = TRIM_START_FRAMES
-    end_idx = len(dx_corr) - TRIM_END_FRAMES
+def _compute_trim_range(n_frames, trim_config):
+    # Intervallo [start_idx, end_idx) dei frame da renderizzare
+    start_idx = trim_config.get("start", 0)
+    end_idx = n_frames - trim_config.get("end", 0)
     if end_idx <= start_idx:
         print("ATTENZIONE: Trimming troppo aggressivo. Analizzo tutti i frame.")
         start_idx = 0
-        end_idx = len(dx_corr)
-
-    if start_idx >= end_idx:
-        print("ERRORE: Il video è troppo corto per i parametri di trimming!")
-        cap.release()
-        out.release()
-        return False
+        end_idx = n_frames
+    return start_idx, end_idx
 
+def _compute_zoom_matrix(dx_corr, dy_corr, start_idx, end_idx, frame_width, frame_height, warper=None):
+    """
+    Calcola la matrice di zoom che nasconde i bordi neri,
+    considerando solo le correzioni nella regione sicura [start_idx, end_idx).
+    Con un warper con rolling shutter, ogni frame include anche lo spostamento
+    aggiuntivo delle righe estreme.
+    """
     print(f"Analisi bordi eseguita solo sui frame {start_idx}-{end_idx}")
 
     # Calcola i massimi delle correzioni
-    safe_dx_corr = dx_corr[start_idx:end_idx]
-    safe_dy_corr = dy_corr[start_idx:end_idx]
+    safe_dx_corr = np.abs(dx_corr[start_idx:end_idx])
+    safe_dy_corr = np.abs(dy_corr[start_idx:end_idx])
 
-    max_dx = np.max(np.abs(safe_dx_corr))
-    max_dy = np.max(np.abs(safe_dy_corr))
+    if warper is not None and warper.rolling_shutter != 0.0:
+        margin_x, margin_y = warper.rolling_shutter_margin()
+        safe_dx_corr = safe_dx_corr + margin_x[start_idx:end_idx]
+        safe_dy_corr = safe_dy_corr + margin_y[start_idx:end_idx]
+
+    max_dx = np.max(safe_dx_corr)
+    max_dy = np.max(safe_dy_corr)
 
     print("Analisi completata (Regione Sicura):")
     print(f"  Correzione Massima X: +/- {max_dx:.2f} pixel")
@@ -101,41 +89,224 @@ def run_phase3(video_input_path, x_act_path, x_smooth_path, output_video_path, t
     M_zoom[1, 1] = zoom_factor
     M_zoom[0, 2] = (frame_width - zoom_factor * frame_width) / 2
     M_zoom[1, 2] = (frame_height - zoom_factor * frame_height) / 2
+    return M_zoom
+
+def _build_warp_matrix(dx, dy, d_theta, M_zoom):
+    """
+    Fonde correzione (dx, dy, dtheta) e zoom in un'unica matrice 2x3,
+    così ogni frame viene interpolato una sola volta.
+    """
+    # Costruisci la matrice di trasformazione 2x3 per la correzione contenente dx, dy, dtheta
+    M_stabilize = np.zeros((2, 3), dtype=np.float32)
+    M_stabilize[0, 0] = np.cos(d_theta)
+    M_stabilize[0, 1] = -np.sin(d_theta)
+    M_stabilize[1, 0] = np.sin(d_theta)
+    M_stabilize[1, 1] = np.cos(d_theta)
+    M_stabilize[0, 2] = dx
+    M_stabilize[1, 2] = dy
+
+    # Zoom applicato dopo la stabilizzazione: M = M_zoom * M_stabilize (coordinate omogenee)
+    M_fused = M_zoom[:, :2] @ M_stabilize
+    M_fused[:, 2] += M_zoom[:, 2]
+    return M_fused
+
+def _stabilize_frame(frame, dx, dy, d_theta, M_zoom, frame_width, frame_height, warper=None, frame_idx=0):
+    # Con un RemapWarper, undistorsione e rolling shutter vengono applicati nello stesso remap
+    if warper is not None:
+        return warper.warp(frame, frame_idx, dx, dy, d_theta, M_zoom)
+
+    # Applica stabilizzazione e zoom (che rimuove i bordi neri) in un solo passaggio
+    M = _build_warp_matrix(dx, dy, d_theta, M_zoom)
+    return cv2.warpAffine(frame, M, (frame_width, frame_height), borderMode=cv2.BORDER_CONSTANT)
+
+def _build_mosaic(tiles, labels, frame_width, frame_height):
+    """
+    Compone i frame in una griglia di confronto affiancata.
+    Ogni tile è ridotta in modo che la griglia abbia colonne = ceil(sqrt(n)).
+    """
+    n = len(tiles)
+    cols = int(np.ceil(np.sqrt(n)))
+    rows = int(np.ceil(n / cols))
+    tile_w = frame_width // cols
+    tile_h = frame_height // cols
+
+    mosaic = np.zeros((rows * tile_h, cols * tile_w, 3), dtype=np.uint8)
+    for i, (tile, label) in enumerate(zip(tiles, labels)):
+        r, c = divmod(i, cols)
+        y0, x0 = r * tile_h, c * tile_w
+        if tile is not None:
+            mosaic[y0:y0 + tile_h, x0:x0 + tile_w] = cv2.resize(tile, (tile_w, tile_h), interpolation=cv2.INTER_AREA)
+        cv2.putText(mosaic, label, (x0 + 10, y0 + 30), cv2.FONT_HERSHEY_SIMPLEX,
+                    0.8, (255, 255, 255), 2, cv2.LINE_AA)
+    return mosaic
+
+def _seek(cap, video_input_path, frame_idx):
+    """
+    Posiziona il capture sul frame frame_idx senza decodificare i frame precedenti.
+    Se il backend non supporta il seek accurato, riapre il file e scarta i frame.
+    Ritorna il capture posizionato.
+    """
+    if frame_idx == 0:
+        return cap
+    cap.set(cv2.CAP_PROP_POS_FRAMES, frame_idx)
+    if int(cap.get(cv2.CAP_PROP_POS_FRAMES)) == frame_idx:
+        return cap
+
+    print(f"ATTENZIONE: Seek non supportato, scarto {frame_idx} frame.")
+    cap.release()
+    cap = cv2.VideoCapture(video_input_path)
+    for _ in range(frame_idx):
+        if not cap.grab():
+            break
+    return cap
+
+def _render_segment(args):
+    """
+    Worker per il rendering parallelo: stabilizza i frame [seg_start, seg_end)
+    e li scrive in un file video parziale.
+    Ritorna il numero di frame scritti.
+    """
+    (video_input_path, part_path, seg_start, seg_end,
+     dx_corr, dy_corr, d_theta_corr, M_zoom, fps, frame_width, frame_height, warper) = args
+
+    # Ogni processo usa un solo thread OpenCV per non saturare i core
+    cv2.setNumThreads(1)
+
+    cap = cv2.VideoCapture(video_input_path)
+    if not cap.isOpened():
+        return 0
+    cap = _seek(cap, video_input_path, seg_start)
+
+    fourcc = cv2.VideoWriter_fourcc(*'mp4v')
+    out = cv2.VideoWriter(part_path, fourcc, fps, (frame_width, frame_height))
+
+    written = 0
+    for i in range(seg_end - seg_start):
+        ret, frame = cap.read()
+        if not ret:
+            break
+        final_frame = _stabilize_frame(frame, dx_corr[i], dy_corr[i], d_theta_corr[i],
+                                       M_zoom, frame_width, frame_height, warper, seg_start + i)
+        out.write(final_frame)
+        written += 1
+
+    cap.release()
+    out.release()
+    return written
+
+def _concat_segments(part_paths, expected_counts, output_video_path, fps, frame_width, frame_height):
+    """
+    Concatena i segmenti nel video finale.
+    Usa il demuxer concat di ffmpeg (copia dei pacchetti, senza ricodifica) se disponibile,
+    altrimenti ricodifica i segmenti con OpenCV (seconda codifica, con perdita),
+    verificando che ogni segmento produca expected_counts[i] frame.
+    Ritorna True se ha successo, False altrimenti.
+    """
+    ffmpeg = shutil.which("ffmpeg")
+    if ffmpeg is not None:
+        list_path = os.path.join(os.path.dirname(part_paths[0]), "segments.txt")
+        with open(list_path, "w") as f:
+            for part_path in part_paths:
+                f.write(f"file '{os.path.abspath(part_path)}'\n")
+        result = subprocess.run(
+            [ffmpeg, "-y", "-loglevel", "error", "-f", "concat", "-safe", "0",
+             "-i", list_path, "-c", "copy", output_video_path],
+            capture_output=True, text=True
+        )
+        if result.returncode == 0:
+            return True
+        print(f"ATTENZIONE: Concatenazione ffmpeg fallita: {result.stderr.strip()}")
+        print("ATTENZIONE: Concatenazione con ricodifica OpenCV (con perdita).")
+    else:
+        print("ATTENZIONE: ffmpeg non disponibile, concatenazione con ricodifica OpenCV (con perdita).")
+
+    fourcc = cv2.VideoWriter_fourcc(*'mp4v')
+    out = cv2.VideoWriter(output_video_path, fourcc, fps, (frame_width, frame_height))
+    if not out.isOpened():
+        print(f"ERRORE (Fase 3): Impossibile scrivere {output_video_path}")
+        return False
+    for i, (part_path, expected) in enumerate(zip(part_paths, expected_counts)):
+        cap = cv2.VideoCapture(part_path)
+        if not cap.isOpened():
+            print(f"ERRORE (Fase 3): Impossibile aprire il segmento {i} ({part_path})")
+            out.release()
+            return False
+
+        count = 0
+        while True:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            out.write(frame)
+            count += 1
+        cap.release()
+
+        if count != expected:
+            print(f"ERRORE (Fase 3): Segmento {i} ricodificato in modo incompleto ({count}/{expected} frame).")
+            out.release()
+            return False
+    out.release()
+    return True
+
+# --- Funzioni Principali ---
+
+def run_phase3(video_input_path, x_act_path, x_smooth_path, output_video_path, trim_config={}, warper=None):
+    """
+    Esegue la Fase 3: Stabilizzazione, Cropping e Trimming.
+    Crea il video finale stabilizzato.
+    Con warper (vedi phase3_remap.RemapWarper) ogni frame è deformato con un unico cv2.remap.
+
+    Ritorna True se ha successo, False altrimenti.
+    """
+    print(f"--- Avvio Fase 3: Stabilizzazione per {output_video_path} ---")
+
+    corrections = _load_corrections(x_act_path, x_smooth_path)
+    if corrections is None:
+        return False
+    dx_corr, dy_corr, d_theta_corr = corrections
+
+    cap = cv2.VideoCapture(video_input_path)
+    if not cap.isOpened():
+        print(f"ERRORE (Fase 3): Impossibile aprire {video_input_path}")
+        return False
+
+    # Informazioni video
+    frame_width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+    frame_height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    fourcc = cv2.VideoWriter_fourcc(*'mp4v')
+
+    output_dir = os.path.dirname(output_video_path)
+    if not os.path.exists(output_dir) and output_dir != '':
+        os.makedirs(output_dir)
+
+    out = cv2.VideoWriter(output_video_path, fourcc, fps, (frame_width, frame_height))
+
+    print(f"Dimensioni video: {frame_width}x{frame_height}")
+
+    # Calcolo dei bordi da nascondere
+    start_idx, end_idx = _compute_trim_range(len(dx_corr), trim_config)
+
+    if start_idx >= end_idx:
+        print("ERRORE: Il video è troppo corto per i parametri di trimming!")
+        cap.release()
+        out.release()
+        return False
+
+    M_zoom = _compute_zoom_matrix(dx_corr, dy_corr, start_idx, end_idx, frame_width, frame_height, warper)
+
+    # Logica di Trimming (Salta i frame all'inizio con un seek, senza decodificarli)
+    cap = _seek(cap, video_input_path, start_idx)
 
     # Applica stabilizzazione e zoom frame per frame
-    frame_idx = 0
-    while True:
+    frame_idx = start_idx
+    while frame_idx < end_idx:
         ret, frame = cap.read()
         if not ret:
             break # Fine del video
-    
-        # Logica di Trimming (Salta i frame all'inizio)
-        if frame_idx < TRIM_START_FRAMES:
-            frame_idx += 1
-            continue
-            
-        # Logica di Trimming (Ferma il loop prima della fine)
-        if frame_idx >= end_idx:
-            break
-        
-        data_idx = frame_idx
-        if data_idx >= len(dx_corr):
-            break
 
-        # Costruisci la matrice di trasformazione 2x3 per la correzione contenente dx, dy, dtheta
-        M_stabilize = np.zeros((2, 3), dtype=np.float32)
-        M_stabilize[0, 0] = np.cos(d_theta_corr[data_idx])
-        M_stabilize[0, 1] = -np.sin(d_theta_corr[data_idx])
-        M_stabilize[1, 0] = np.sin(d_theta_corr[data_idx])
-        M_stabilize[1, 1] = np.cos(d_theta_corr[data_idx])
-        M_stabilize[0, 2] = dx_corr[data_idx]
-        M_stabilize[1, 2] = dy_corr[data_idx]
-        
-        # Applica stabilizzazione (bordi neri)
-        stabilized_frame = cv2.warpAffine(frame, M_stabilize, (frame_width, frame_height), borderMode=cv2.BORDER_CONSTANT)
-        
-        # Applica zoom (rimuove bordi neri)
-        final_frame = cv2.warpAffine(stabilized_frame, M_zoom, (frame_width, frame_height), borderMode=cv2.BORDER_CONSTANT)
+        final_frame = _stabilize_frame(frame, dx_corr[frame_idx], dy_corr[frame_idx], d_theta_corr[frame_idx],
+                                       M_zoom, frame_width, frame_height, warper, frame_idx)
 
         out.write(final_frame)
         frame_idx += 1
@@ -146,4 +317,198 @@ def run_phase3(video_input_path, x_act_path, x_smooth_path, output_video_path, t
     print("-" * 30)
     print("Stabilizzazione + Cropping completati.")
     print(f"File salvato in: {output_video_path}")
-    return True
\ No newline at end of file
+    return True
+
+def run_phase3_parallel(video_input_path, x_act_path, x_smooth_path, output_video_path, trim_config={}, n_workers=None, warper=None):
+    """
+    Variante parallela della Fase 3.
+    Divide l'intervallo di frame in n_workers segmenti: ogni processo si posiziona
+    con un seek all'inizio del proprio segmento, lo stabilizza e lo codifica.
+    I segmenti vengono poi concatenati nel video finale.
+
+    Ritorna True se ha successo, False altrimenti.
+    """
+    if n_workers is None:
+        n_workers = os.cpu_count() or 1
+    print(f"--- Avvio Fase 3 (Parallela, {n_workers} processi): Stabilizzazione per {output_video_path} ---")
+
+    corrections = _load_corrections(x_act_path, x_smooth_path)
+    if corrections is None:
+        return False
+    dx_corr, dy_corr, d_theta_corr = corrections
+
+    cap = cv2.VideoCapture(video_input_path)
+    if not cap.isOpened():
+        print(f"ERRORE (Fase 3): Impossibile aprire {video_input_path}")
+        return False
+
+    # Informazioni video
+    frame_width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+    frame_height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    n_video_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    cap.release()
+
+    print(f"Dimensioni video: {frame_width}x{frame_height}")
+
+    output_dir = os.path.dirname(output_video_path)
+    if not os.path.exists(output_dir) and output_dir != '':
+        os.makedirs(output_dir)
+
+    start_idx, end_idx = _compute_trim_range(len(dx_corr), trim_config)
+    if n_video_frames > 0:
+        end_idx = min(end_idx, n_video_frames)
+
+    if start_idx >= end_idx:
+        print("ERRORE: Il video è troppo corto per i parametri di trimming!")
+        return False
+
+    M_zoom = _compute_zoom_matrix(dx_corr, dy_corr, start_idx, end_idx, frame_width, frame_height, warper)
+
+    # Suddivisione in segmenti contigui
+    n_workers = max(1, min(n_workers, end_idx - start_idx))
+    bounds = np.linspace(start_idx, end_idx, n_workers + 1).astype(int)
+
+    with tempfile.TemporaryDirectory(dir=output_dir or None) as tmp_dir:
+        tasks = []
+        part_paths = []
+        for i in range(n_workers):
+            seg_start, seg_end = int(bounds[i]), int(bounds[i + 1])
+            part_path = os.path.join(tmp_dir, f"part_{i:03d}.mp4")
+            part_paths.append(part_path)
+            tasks.append((video_input_path, part_path, seg_start, seg_end,
+                          dx_corr[seg_start:seg_end], dy_corr[seg_start:seg_end], d_theta_corr[seg_start:seg_end],
+                          M_zoom, fps, frame_width, frame_height, warper))
+            print(f"  Segmento {i}: frame {seg_start}-{seg_end}")
+
+        # "spawn" evita i deadlock dei thread interni di OpenCV dopo un fork
+        ctx = multiprocessing.get_context("spawn")
+        with ctx.Pool(processes=n_workers) as pool:
+            written = pool.map(_render_segment, tasks)
+
+        # Un segmento incompleto lascerebbe un buco nel video finale
+        incomplete = False
+        for i, (seg_start, seg_end) in enumerate(zip(bounds[:-1], bounds[1:])):
+            if written[i] != seg_end - seg_start:
+                print(f"ERRORE (Fase 3): Segmento {i} incompleto ({written[i]}/{seg_end - seg_start} frame).")
+                incomplete = True
+        if incomplete:
+            return False
+
+        if not _concat_segments(part_paths, written, output_video_path, fps, frame_width, frame_height):
+            print("ERRORE (Fase 3): Concatenazione dei segmenti fallita.")
+            return False
+
+    print("-" * 30)
+    print("Stabilizzazione + Cropping completati.")
+    print(f"File salvato in: {output_video_path}")
+    return True
+
+def run_phase3_multi(video_input_path, x_act_path, variants, mosaic_path=None, warper=None):
+    """
+    Variante multi-output della Fase 3 per il confronto tra algoritmi.
+    Decodifica ogni frame una sola volta e applica le K trasformazioni,
+    scrivendo K video stabilizzati ed eventualmente un mosaico di confronto.
+
+    variants: lista di dizionari con chiavi
+      "name", "x_smooth_path", "output_video_path" e (opzionale) "trim_config".
+
+    Ritorna True se ha successo, False altrimenti.
+    """
+    print(f"--- Avvio Fase 3 (Multi-output, {len(variants)} varianti): Stabilizzazione per {video_input_path} ---")
+
+    if len(variants) == 0:
+        print("ERRORE (Fase 3): Nessuna variante da renderizzare.")
+        return False
+
+    cap = cv2.VideoCapture(video_input_path)
+    if not cap.isOpened():
+        print(f"ERRORE (Fase 3): Impossibile aprire {video_input_path}")
+        return False
+
+    # Informazioni video
+    frame_width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+    frame_height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    fourcc = cv2.VideoWriter_fourcc(*'mp4v')
+
+    print(f"Dimensioni video: {frame_width}x{frame_height}")
+
+    # Preparazione di ogni variante: correzioni, intervallo di trimming, zoom e writer
+    states = []
+    for variant in variants:
+        print(f"Variante: {variant['name']}")
+        corrections = _load_corrections(x_act_path, variant["x_smooth_path"])
+        if corrections is None:
+            cap.release()
+            for state in states:
+                state["out"].release()
+            return False
+        dx_corr, dy_corr, d_theta_corr = corrections
+
+        start_idx, end_idx = _compute_trim_range(len(dx_corr), variant.get("trim_config", {}))
+        M_zoom = _compute_zoom_matrix(dx_corr, dy_corr, start_idx, end_idx, frame_width, frame_height, warper)
+
+        output_dir = os.path.dirname(variant["output_video_path"])
+        if not os.path.exists(output_dir) and output_dir != '':
+            os.makedirs(output_dir)
+
+        states.append({
+            "name": variant["name"],
+            "path": variant["output_video_path"],
+            "dx": dx_corr, "dy": dy_corr, "d_theta": d_theta_corr,
+            "start": start_idx, "end": end_idx,
+            "M_zoom": M_zoom,
+            "out": cv2.VideoWriter(variant["output_video_path"], fourcc, fps, (frame_width, frame_height)),
+        })
+
+    mosaic_out = None
+    if mosaic_path is not None:
+        mosaic_dir = os.path.dirname(mosaic_path)
+        if not os.path.exists(mosaic_dir) and mosaic_dir != '':
+            os.makedirs(mosaic_dir)
+        labels = ["Originale"] + [state["name"] for state in states]
+        # Dimensioni della griglia calcolate su un frame vuoto
+        empty = [None] * len(labels)
+        mosaic_h, mosaic_w = _build_mosaic(empty, labels, frame_width, frame_height).shape[:2]
+        mosaic_out = cv2.VideoWriter(mosaic_path, fourcc, fps, (mosaic_w, mosaic_h))
+
+    # Si decodifica solo l'unione degli intervalli delle varianti
+    global_start = min(state["start"] for state in states)
+    global_end = max(state["end"] for state in states)
+    cap = _seek(cap, video_input_path, global_start)
+
+    frame_idx = global_start
+    while frame_idx < global_end:
+        ret, frame = cap.read()
+        if not ret:
+            break # Fine del video
+
+        tiles = [frame]
+        for state in states:
+            if state["start"] <= frame_idx < state["end"]:
+                final_frame = _stabilize_frame(frame, state["dx"][frame_idx], state["dy"][frame_idx],
+                                               state["d_theta"][frame_idx], state["M_zoom"],
+                                               frame_width, frame_height, warper, frame_idx)
+                state["out"].write(final_frame)
+                tiles.append(final_frame)
+            else:
+                tiles.append(None) # Frame escluso dal trimming di questa variante
+
+        if mosaic_out is not None:
+            mosaic_out.write(_build_mosaic(tiles, labels, frame_width, frame_height))
+        frame_idx += 1
+
+    cap.release()
+    for state in states:
+        state["out"].release()
+    if mosaic_out is not None:
+        mosaic_out.release()
+
+    print("-" * 30)
+    print("Stabilizzazione + Cropping completati.")
+    for state in states:
+        print(f"File salvato in: {state['path']}")
+    if mosaic_path is not None:
+        print(f"Mosaico di confronto salvato in: {mosaic_path}")
+    return True